@@ -5,11 +5,19 @@ def get_args():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("url", help="URL of the server")
+    parser.add_argument("-i", "--interval", type=float, default=0,
+                        help="keep running and report every INTERVAL seconds, "
+                             "collectors then reuse their caches and previous samples")
     return parser.parse_args()
 def main():
+    import time
     args = get_args()
     collector = SystemStatsCollector(args.url)
-    collector.send_stats()
+    while True:
+        collector.send_stats()
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
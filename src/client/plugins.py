@@ -5,10 +5,17 @@ import json
 import socket
 import urllib.request
 import urllib.error
+import http.client
 import subprocess
 import shutil
+import select
+import threading
+import heapq
 from datetime import datetime
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+
+# counter snapshots survive between one-shot runs here
+STATE_DIR = os.environ.get('SIMPLEPANEL_STATE_DIR', os.path.expanduser('~/.cache/simplepanel'))
 
 class StatsRegistry:
     _registry: Dict[str, type] = {}
@@ -187,31 +194,69 @@ class MemoryStats(BaseStats):
 
 @StatsRegistry.register("disk")
 class DiskStats(BaseStats):
-    def __init__(self):
+    FS_TYPES = ['ext4', 'ext3', 'ext2', 'xfs', 'btrfs', 'ntfs', 'fat', 'vfat', 'fuseblk', 'f2fs']
+
+    def __init__(self, timeout: float = 2):
         super().__init__()
-    
+        self.timeout = timeout
+        self.mounts_file = None
+        self.mounts_poll = None
+        self.mount_points: List[Dict[str, str]] = []
+        # mount point -> statvfs thread that missed its deadline and may still hang
+        self.pending: Dict[str, threading.Thread] = {}
+        self._watch_mounts()
+
+    def _watch_mounts(self):
+        try:
+            self.mounts_file = open('/proc/mounts', 'r')
+            self.mounts_poll = select.poll()
+            self.mounts_poll.register(self.mounts_file, select.POLLPRI | select.POLLERR)
+        except Exception as e:
+            print(f"Error watching mount points: {e}")
+            self.mounts_file = self.mounts_poll = None
+
+    def _mounts_changed(self) -> bool:
+        """/proc/mounts signals POLLPRI | POLLERR when the mount table changes"""
+        if self.mounts_poll is None:
+            return True
+        return bool(self.mounts_poll.poll(0))
+
+    def _read_mounts(self) -> str:
+        if self.mounts_file is None:
+            with open('/proc/mounts', 'r') as f:
+                return f.read()
+        self.mounts_file.seek(0)
+        return self.mounts_file.read()
+
     def _get_mount_points(self) -> List[Dict[str, str]]:
+        if self.mount_points and not self._mounts_changed():
+            return self.mount_points
+
         mount_points = []
+        seen_devices = set()
         try:
-            with open('/proc/mounts', 'r') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) >= 2:
-                        device = parts[0]
-                        mount_point = parts[1]
-                        fs_type = parts[2]
-                        
-                        if (fs_type in ['ext4', 'ext3', 'ext2', 'xfs', 'btrfs', 'ntfs', 'fat', 'vfat', 'fuseblk', 'f2fs'] and 
-                            not mount_point.startswith('/sys/') and 
-                            not mount_point.startswith('/boot') and 
-                            not mount_point.startswith('/proc/') and
-                            not mount_point.startswith('/dev/') and
-                            not mount_point.startswith('/run/')):
-                            mount_points.append({
-                                "device": device,
-                                "mount_point": mount_point,
-                                "fs_type": fs_type
-                            })
+            for line in self._read_mounts().splitlines():
+                parts = line.strip().split()
+                if len(parts) >= 3:
+                    device = parts[0]
+                    mount_point = parts[1]
+                    fs_type = parts[2]
+
+                    # bind mounts of the same device report the same usage
+                    if device in seen_devices:
+                        continue
+                    if (fs_type in self.FS_TYPES and
+                        not mount_point.startswith('/sys/') and 
+                        not mount_point.startswith('/boot') and 
+                        not mount_point.startswith('/proc/') and
+                        not mount_point.startswith('/dev/') and
+                        not mount_point.startswith('/run/')):
+                        seen_devices.add(device)
+                        mount_points.append({
+                            "device": device,
+                            "mount_point": mount_point,
+                            "fs_type": fs_type
+                        })
         except Exception as e:
             print(f"Error reading mount points: {e}")
         
@@ -223,38 +268,428 @@ class DiskStats(BaseStats):
                 "fs_type": "unknown"
             })
         
+        self.mount_points = mount_points
         return mount_points
-    
+
+    def _statvfs_all(self, mount_points: List[str]) -> Dict[str, Any]:
+        """statvfs every mount concurrently, a mount missing the deadline is left out"""
+        results: Dict[str, Any] = {}
+
+        def worker(path):
+            try:
+                results[path] = os.statvfs(path)
+            except Exception as e:
+                results[path] = e
+
+        threads = {}
+        for path in mount_points:
+            # do not pile up threads behind a mount that is still hanging
+            if path in self.pending and self.pending[path].is_alive():
+                continue
+            # daemon threads never block the agent from exiting
+            thread = threading.Thread(target=worker, args=(path,), daemon=True)
+            thread.start()
+            threads[path] = thread
+
+        deadline = time.monotonic() + self.timeout
+        for path, thread in threads.items():
+            thread.join(max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                self.pending[path] = thread
+            else:
+                self.pending.pop(path, None)
+        return {path: results[path] for path in threads if path in results}
+
     def collect(self) -> Dict[str, Any]:
         mount_points = self._get_mount_points()
+        usages = self._statvfs_all([mp["mount_point"] for mp in mount_points])
         disks = []
         
         for mp in mount_points:
             mount_point = mp["mount_point"]
-            try:
-                total, used, free = shutil.disk_usage(mount_point)
-                
-                # byte -> GiB
-                total_gb = round(total / (1024**3), 2)
-                used_gb = round(used / (1024**3), 2)
-                free_gb = round(free / (1024**3), 2)
-                used_percent = round(100 * used / total, 2) if total > 0 else 0
-                
+            usage = usages.get(mount_point)
+            if not isinstance(usage, os.statvfs_result):
+                error = str(usage) if usage is not None else "timeout"
+                print(f"Error getting disk usage for {mount_point}: {error}")
                 disks.append({
                     "device": mp["device"],
                     "mount_point": mount_point,
                     "fs_type": mp["fs_type"],
-                    "total_gb": total_gb,
-                    "used_gb": used_gb,
-                    "free_gb": free_gb,
-                    "used_percent": used_percent
+                    "available": False,
+                    "error": error,
+                    "total_gb": 0,
+                    "used_gb": 0,
+                    "free_gb": 0,
+                    "used_percent": 0
                 })
-            except Exception as e:
-                print(f"Error getting disk usage for {mount_point}: {e}")
+                continue
+
+            # same arithmetic as shutil.disk_usage
+            total = usage.f_blocks * usage.f_frsize
+            used = (usage.f_blocks - usage.f_bfree) * usage.f_frsize
+            free = usage.f_bavail * usage.f_frsize
+
+            # byte -> GiB
+            total_gb = round(total / (1024**3), 2)
+            used_gb = round(used / (1024**3), 2)
+            free_gb = round(free / (1024**3), 2)
+            used_percent = round(100 * used / total, 2) if total > 0 else 0
+
+            disks.append({
+                "device": mp["device"],
+                "mount_point": mount_point,
+                "fs_type": mp["fs_type"],
+                "available": True,
+                "total_gb": total_gb,
+                "used_gb": used_gb,
+                "free_gb": free_gb,
+                "used_percent": used_percent
+            })
         
         return {"disks": disks}
 
 
+class PersistentStats(BaseStats):
+    """Collector whose previous sample is persisted to STATE_DIR.
+
+    One-shot runs (cron) then compare against the last report instead of
+    sampling twice. Samples taken before the last reboot are ignored.
+    """
+    state_name = ""
+
+    def __init__(self):
+        super().__init__()
+        self.state_file = os.path.join(STATE_DIR, f"{self.state_name}.json")
+        self.boot_id = self._read_boot_id()
+
+    @staticmethod
+    def _read_boot_id() -> str:
+        try:
+            with open('/proc/sys/kernel/random/boot_id', 'r') as f:
+                return f.read().strip()
+        except Exception:
+            return ""
+
+    @staticmethod
+    def _now() -> float:
+        # keeps counting across processes and suspend, reset on reboot
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+
+    def _load_state_file(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            if state["boot_id"] != self.boot_id:
+                # counters, pids and clock restarted with the kernel
+                return None
+            return state
+        except Exception:
+            return None
+
+    def _save_state_file(self, state: Dict[str, Any]):
+        try:
+            os.makedirs(STATE_DIR, exist_ok=True)
+            tmp = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(dict(state, boot_id=self.boot_id), f)
+            os.replace(tmp, self.state_file)
+        except Exception as e:
+            print(f"Error saving {self.state_name} state: {e}")
+
+
+@StatsRegistry.register("processes")
+class ProcessStats(PersistentStats):
+    state_name = "processes"
+
+    def __init__(self, top_n: int = 10, interval: float = 0.5, budget_ms: float = 200):
+        super().__init__()
+        self.top_n = top_n
+        self.interval = interval
+        self.budget_ms = budget_ms
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.total_mem = os.sysconf('SC_PHYS_PAGES') * self.page_size
+        # pid -> (starttime, utime + stime), starttime guards against pid reuse
+        self.prev_scan: Dict[int, Tuple[int, int]] = {}
+        self.prev_time = 0.0
+        # whether prev_scan covers every process
+        self.prev_complete = False
+
+    def _scan(self) -> Tuple[Dict[int, Tuple[str, int, int, int]], bool]:
+        """pid -> (name, starttime, cpu ticks, rss pages), and whether the budget ran out
+
+        Only /proc/<pid>/stat is read: it already carries rss (same value as
+        the second field of statm), so one open per pid is enough.
+        """
+        procs = {}
+        deadline = time.process_time() + self.budget_ms / 1000
+        with os.scandir('/proc') as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                if len(procs) % 64 == 63 and time.process_time() > deadline:
+                    return procs, True
+                try:
+                    fd = os.open(f'/proc/{entry.name}/stat', os.O_RDONLY)
+                    try:
+                        raw = os.read(fd, 1024)
+                    finally:
+                        os.close(fd)
+                except OSError:
+                    # exited while scanning
+                    continue
+                # comm may contain spaces and parentheses, split on the last ')'
+                head, _, tail = raw.rpartition(b')')
+                fields = tail.split()
+                # fields[0] is the state (field 3 in proc(5))
+                procs[int(entry.name)] = (
+                    head.partition(b'(')[2].decode('utf-8', 'replace'),
+                    int(fields[19]),
+                    int(fields[11]) + int(fields[12]),
+                    int(fields[21]),
+                )
+        return procs, False
+
+    def _remember(self, now: float, procs: Dict[int, Tuple[str, int, int, int]], complete: bool):
+        self.prev_scan = {pid: (p[1], p[2]) for pid, p in procs.items()}
+        self.prev_time = now
+        self.prev_complete = complete
+
+    def _load_state(self) -> bool:
+        state = self._load_state_file()
+        if state is None:
+            return False
+        # flat [pid, starttime, ticks, ...] keeps the file small
+        flat = state["scan"]
+        self.prev_scan = {flat[i]: (flat[i + 1], flat[i + 2]) for i in range(0, len(flat), 3)}
+        self.prev_time = state["time"]
+        self.prev_complete = state["complete"]
+        return True
+
+    def _save_state(self):
+        flat = [x for pid, (start, ticks) in self.prev_scan.items() for x in (pid, start, ticks)]
+        self._save_state_file({"time": self.prev_time, "complete": self.prev_complete, "scan": flat})
+
+    def collect(self) -> Dict[str, Any]:
+        try:
+            cpu_start = time.process_time()
+            if not self.prev_scan and not self._load_state():
+                # very first run: baseline scan, it has a budget of its own
+                procs, truncated = self._scan()
+                self._remember(self._now(), procs, not truncated)
+            if self._now() - self.prev_time < self.interval:
+                time.sleep(self.interval - (self._now() - self.prev_time))
+
+            procs, truncated = self._scan()
+            now = self._now()
+            elapsed_ticks = (now - self.prev_time) * self.clock_ticks
+            # ranking a partial scan would only rank the lowest pids
+            rank_cpu = not truncated and self.prev_complete
+            rank_memory = not truncated
+            if truncated:
+                print(f"Process scan exceeded {self.budget_ms} ms after {len(procs)} processes, not ranking")
+
+            def entries():
+                for pid, (name, start, ticks, rss) in procs.items():
+                    prev = self.prev_scan.get(pid)
+                    delta = ticks - prev[1] if prev and prev[0] == start else 0
+                    yield delta, rss, pid, name
+
+            def to_json(entry):
+                delta, rss, pid, name = entry
+                rss_bytes = rss * self.page_size
+                return {
+                    "pid": pid,
+                    "name": name,
+                    "cpu_percent": round(100 * delta / elapsed_ticks, 2) if elapsed_ticks > 0 else 0,
+                    "rss_mb": round(rss_bytes / (1024**2), 2),
+                    "memory_percent": round(100 * rss_bytes / self.total_mem, 2) if self.total_mem > 0 else 0,
+                }
+
+            # bounded heaps, O(n log top_n)
+            top_cpu = heapq.nlargest(self.top_n, entries(), key=lambda e: e[0]) if rank_cpu else []
+            top_memory = heapq.nlargest(self.top_n, entries(), key=lambda e: e[1]) if rank_memory else []
+
+            self._remember(now, procs, not truncated)
+            self._save_state()
+
+            return {
+                "count": len(procs),
+                "truncated": truncated,
+                "scan_cpu_ms": round((time.process_time() - cpu_start) * 1000, 2),
+                "top_cpu": [to_json(e) for e in top_cpu],
+                "top_memory": [to_json(e) for e in top_memory],
+            }
+        except Exception as e:
+            print(f"Error getting process stats: {e}")
+            return {"count": 0, "truncated": False, "scan_cpu_ms": 0, "top_cpu": [], "top_memory": []}
+
+
+class CounterStats(PersistentStats):
+    """Rates from monotonic kernel counters.
+
+    The previous snapshot is kept in memory and persisted to STATE_DIR, so a
+    one-shot run (cron) reports the average rate since the last report. The
+    very first run has nothing to compare with and samples twice.
+    """
+    # positions of counters the kernel keeps in 32 bits, the others are 64-bit
+    # and going down means the device was reset or recreated, not a wrap
+    WRAP_32_FIELDS: Tuple[int, ...] = ()
+
+    def __init__(self, interval: float = 1):
+        super().__init__()
+        self.interval = interval
+        self.prev: Optional[Tuple[float, Dict[str, List[int]]]] = None
+
+    def _read_counters(self) -> Dict[str, List[int]]:
+        raise NotImplementedError("Subclass must implement abstract method")
+
+    def _rates(self, name: str, delta: List[int], elapsed: float) -> Dict[str, Any]:
+        raise NotImplementedError("Subclass must implement abstract method")
+
+    @staticmethod
+    def _counter_delta(current: int, previous: int, wraps_32: bool) -> Optional[int]:
+        """None when the counter was reset"""
+        if current >= previous:
+            return current - previous
+        if wraps_32 and previous < 2**32:
+            return current + 2**32 - previous
+        return None
+
+    def _load_state(self) -> Optional[Tuple[float, Dict[str, List[int]]]]:
+        state = self._load_state_file()
+        return (state["time"], state["counters"]) if state else None
+
+    def _save_state(self):
+        self._save_state_file({"time": self.prev[0], "counters": self.prev[1]})
+
+    def _collect_rates(self) -> Tuple[float, List[Dict[str, Any]]]:
+        prev = self.prev or self._load_state()
+        now, counters = self._now(), self._read_counters()
+        if prev is None:
+            prev = now, counters
+        if now - prev[0] < self.interval:
+            # too short a window for meaningful rates
+            time.sleep(self.interval - (now - prev[0]))
+            now, counters = self._now(), self._read_counters()
+        self.prev = now, counters
+        self._save_state()
+
+        elapsed = now - prev[0]
+        rates = []
+        for name, values in counters.items():
+            old = prev[1].get(name)
+            if old is None or len(old) != len(values):
+                # appeared since the last snapshot
+                continue
+            delta = [
+                self._counter_delta(c, p, i in self.WRAP_32_FIELDS)
+                for i, (c, p) in enumerate(zip(values, old))
+            ]
+            if None in delta:
+                # reset since the last snapshot, no meaningful rate this time
+                continue
+            rates.append(self._rates(name, delta, elapsed))
+        return elapsed, rates
+
+
+@StatsRegistry.register("diskio")
+class DiskIOStats(CounterStats):
+    state_name = "diskio"
+    SECTOR_SIZE = 512
+    # io_ticks is an unsigned int in the kernel
+    WRAP_32_FIELDS = (4,)
+    IGNORED_PREFIXES = ('loop', 'ram', 'zram', 'sr', 'fd')
+
+    def _read_counters(self) -> Dict[str, List[int]]:
+        try:
+            # whole devices only, partitions would count the same I/O twice
+            block_devices = set(os.listdir('/sys/block'))
+        except OSError:
+            block_devices = None
+
+        with open('/proc/diskstats', 'r') as f:
+            lines = f.read().splitlines()
+
+        counters = {}
+        for line in lines:
+            parts = line.split()
+            if len(parts) < 14:
+                continue
+            name = parts[2]
+            if name.startswith(self.IGNORED_PREFIXES):
+                continue
+            if block_devices is not None and name not in block_devices:
+                continue
+            # reads, sectors read, writes, sectors written, ms doing I/O
+            counters[name] = [int(parts[i]) for i in (3, 5, 7, 9, 12)]
+        return counters
+
+    def _rates(self, name: str, delta: List[int], elapsed: float) -> Dict[str, Any]:
+        reads, sectors_read, writes, sectors_written, io_ms = delta
+        return {
+            "name": name,
+            "read_bytes_per_s": round(sectors_read * self.SECTOR_SIZE / elapsed, 2),
+            "write_bytes_per_s": round(sectors_written * self.SECTOR_SIZE / elapsed, 2),
+            "read_iops": round(reads / elapsed, 2),
+            "write_iops": round(writes / elapsed, 2),
+            "util_percent": round(min(100, io_ms / 10 / elapsed), 2),
+        }
+
+    def collect(self) -> Dict[str, Any]:
+        try:
+            elapsed, devices = self._collect_rates()
+            return {"interval_s": round(elapsed, 2), "devices": devices}
+        except Exception as e:
+            print(f"Error getting disk I/O stats: {e}")
+            return {"interval_s": 0, "devices": []}
+
+
+@StatsRegistry.register("network")
+class NetworkStats(CounterStats):
+    state_name = "network"
+
+    def _read_counters(self) -> Dict[str, List[int]]:
+        with open('/proc/net/dev', 'r') as f:
+            # two header lines
+            lines = f.read().splitlines()[2:]
+
+        counters = {}
+        for line in lines:
+            name, _, values = line.partition(':')
+            name = name.strip()
+            parts = values.split()
+            if len(parts) < 16:
+                continue
+            # physical NICs only: lo, veth, bridges, docker... have no device,
+            # on container hosts hundreds of them would bloat every report
+            if not os.path.exists(f'/sys/class/net/{name}/device'):
+                continue
+            # rx bytes, packets, errs, drop, tx bytes, packets, errs, drop
+            counters[name] = [int(parts[i]) for i in (0, 1, 2, 3, 8, 9, 10, 11)]
+        return counters
+
+    def _rates(self, name: str, delta: List[int], elapsed: float) -> Dict[str, Any]:
+        rx_bytes, rx_packets, rx_errs, rx_drop, tx_bytes, tx_packets, tx_errs, tx_drop = delta
+        return {
+            "interface": name,
+            "rx_bytes_per_s": round(rx_bytes / elapsed, 2),
+            "tx_bytes_per_s": round(tx_bytes / elapsed, 2),
+            "rx_packets_per_s": round(rx_packets / elapsed, 2),
+            "tx_packets_per_s": round(tx_packets / elapsed, 2),
+            "rx_errors": rx_errs + rx_drop,
+            "tx_errors": tx_errs + tx_drop,
+        }
+
+    def collect(self) -> Dict[str, Any]:
+        try:
+            elapsed, interfaces = self._collect_rates()
+            return {"interval_s": round(elapsed, 2), "interfaces": interfaces}
+        except Exception as e:
+            print(f"Error getting network stats: {e}")
+            return {"interval_s": 0, "interfaces": []}
+
+
 @StatsRegistry.register("system")
 class SystemStats(BaseStats):
     def __init__(self):
@@ -295,8 +730,9 @@ class SystemStats(BaseStats):
             }
 
 class SystemStatsCollector:
-    def __init__(self, server_url: str, stats_list: List[str]=[]):
+    def __init__(self, server_url: str, stats_list: List[str]=[], timeout: float = 30):
         self.server_url = server_url
+        self.timeout = timeout
         self.stats_classes = {}
 
         if not stats_list:
@@ -334,9 +770,11 @@ class SystemStatsCollector:
                 data=data,
                 headers={'Content-Type': 'application/json'}
             )
-            with urllib.request.urlopen(req) as response:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
                 print(f"[{datetime.now().strftime('%Y-%m-%d/%H')}] Stats sent successfully. Response: {response.status}")
                 return True
-        except urllib.error.URLError as e:
+        # URLError is an OSError, errors while reading the response
+        # (RemoteDisconnected, timeouts...) are raised unwrapped
+        except (OSError, http.client.HTTPException) as e:
             print(f"Error sending stats: {e}")
             return False
\ No newline at end of file
@@ -2,30 +2,93 @@
 # requires-python = ">=3.10"
 # dependencies = [fastapi, jinja2, uvicorn]
 # ///
+import os
+import re
+import io
+import csv
 import json
-from datetime import datetime
+import gzip
+import time
+import asyncio
+import mmap
+import fcntl
+import struct
+import zlib
+import heapq
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
 from typing import Any
 from pathlib import Path
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, HTTPException, Query
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 import uvicorn
 
-app = FastAPI(title="Server Status Monitor")
-
-DATA_DIR = Path("data")
+DATA_DIR = Path(os.environ.get("SIMPLEPANEL_DATA", "data"))
 DATA_DIR.mkdir(exist_ok=True)
 
+# relay mode: keep only the latest state and forward reports to this server
+UPSTREAM_URL = os.environ.get("SIMPLEPANEL_UPSTREAM", "").rstrip("/")
+SPOOL_DIR = DATA_DIR / ".spool"
+SPOOL_REJECTED_DIR = SPOOL_DIR / "rejected"
+SPOOL_LOCK_FILE = DATA_DIR / ".spool.lock"
+# spool files are locked by stripe, a byte of this file each
+SPOOL_WRITE_LOCK_FILE = DATA_DIR / ".spool.write.lock"
+SPOOL_LOCK_STRIPES = 1024
+RELAY_INTERVAL = 30
+RELAY_BATCH_SIZE = 500
+
+LATEST_TABLE_FILE = DATA_DIR / ".latest.tbl"
+# at most this many hosts are served from shared memory, the others fall back to
+# reading latest.json. Remove data/.latest.tbl after changing it.
+LATEST_TABLE_SLOTS = int(os.environ.get("SIMPLEPANEL_TABLE_SLOTS", "1024"))
+LATEST_TABLE_SLOT_SIZE = 16 * 1024
+
+MANIFEST_FILE = DATA_DIR / ".manifest.json.gz"
+MANIFEST_LOCK_FILE = DATA_DIR / ".manifest.lock"
+MANIFEST_INTERVAL = 600
+# a changed host is reconciled by probing the hours since its last indexed file,
+# further behind than this its directory is scanned again
+RECONCILE_MAX_HOURS = 31 * 24
+# missing hours this far before the index was last complete are probed as well,
+# covering late reports and clients in another timezone
+RECONCILE_SLACK_HOURS = 24
+
+EXPORT_DEFAULT_FIELDS = [
+    "hostname",
+    "timestamp",
+    "cpu.usage",
+    "memory.used_percent",
+    "memory.swap.used_percent",
+]
+# bytes buffered before a chunk is sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# weight of a disk usage sample halves every FORECAST_HALF_LIFE_HOURS
+FORECAST_HALF_LIFE_HOURS = 72
+# a host without a forecast replays this many half-lives of its history,
+# older samples would weigh less than 0.1%
+FORECAST_REPLAY_HALF_LIVES = 10
+
 templates_dir = Path("template")
 templates = Jinja2Templates(directory=str(templates_dir))
 
 
 def get_avg_disk_usage(data):
-    if "disk" not in data or "disks" not in data["disk"] or not data["disk"]["disks"]:
+    if "disk" not in data or "disks" not in data["disk"]:
         return 0
 
-    total = sum(disk["used_percent"] for disk in data["disk"]["disks"])
-    return round(total / len(data["disk"]["disks"]), 2)
+    # mounts the client could not stat report zero usage
+    disks = [disk for disk in data["disk"]["disks"] if disk.get("available", True)]
+    if not disks:
+        return 0
+
+    total = sum(disk["used_percent"] for disk in disks)
+    return round(total / len(disks), 2)
 
 
 templates.env.filters["get_avg_disk_usage"] = get_avg_disk_usage
@@ -73,6 +136,307 @@ def determine_status(data: dict[str, Any]) -> str:
         return "normal"
 
 
+class LatestStateTable:
+    """Latest report of every host, shared by all workers through a mmap file.
+
+    The file is a header followed by fixed-size slots, one per host, located by
+    linear probing from crc32(hostname). Every slot starts with a sequence
+    number used as a seqlock: writers (serialized by a fcntl lock on the slot)
+    make it odd while they write and even again when done, readers never lock
+    and simply retry when the sequence is odd or changed under them.
+    """
+
+    MAGIC = b"SPLTBL01"
+    HEADER = struct.Struct("<8sII")
+    HEADER_SIZE = 64
+    # seq, flags, name length, payload length, name, timestamp
+    SLOT_HEADER = struct.Struct("<QHHI64s32s")
+    FLAG_OVERFLOW = 1
+    READ_SPINS = 1000
+
+    def __init__(self, path: Path, slots: int, slot_size: int):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_payload = slot_size - self.SLOT_HEADER.size
+        self.lock = threading.Lock()
+        size = self.HEADER_SIZE + slots * slot_size
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, self.HEADER_SIZE, 0)
+        try:
+            if os.fstat(self.fd).st_size < size:
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, self.HEADER.pack(self.MAGIC, slots, slot_size), 0)
+            header = self.HEADER.unpack(os.pread(self.fd, self.HEADER.size, 0))
+            if header != (self.MAGIC, slots, slot_size):
+                raise RuntimeError(f"{path} has an incompatible layout, remove it")
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, self.HEADER_SIZE, 0)
+        self.mm = mmap.mmap(self.fd, size)
+
+    def _offset(self, index: int) -> int:
+        return self.HEADER_SIZE + index * self.slot_size
+
+    def _probe(self, hostname: str):
+        start = zlib.crc32(hostname.encode("utf-8")) % self.slots
+        for i in range(self.slots):
+            yield (start + i) % self.slots
+
+    def _snapshot(self, offset: int):
+        seq, flags, name_len, data_len, name, ts = self.SLOT_HEADER.unpack_from(
+            self.mm, offset
+        )
+        data_start = offset + self.SLOT_HEADER.size
+        payload = self.mm[data_start : data_start + min(data_len, self.max_payload)]
+        return seq, (name[:name_len], flags, ts.rstrip(b"\0"), payload)
+
+    @staticmethod
+    def _decode_name(slot) -> tuple[str, int, bytes, bytes] | None:
+        # only a slot left torn by a dead writer can hold invalid utf-8
+        name, flags, ts, payload = slot
+        return (name.decode("utf-8", "replace"), flags, ts, payload) if name else None
+
+    def _read_slot(self, index: int, locked: bool = False) -> tuple[str, int, bytes, bytes] | None:
+        """consistent (name, flags, timestamp, payload) of a slot, None if empty"""
+        offset = self._offset(index)
+        if locked:
+            return self._decode_name(self._snapshot(offset)[1])
+        for _ in range(self.READ_SPINS):
+            seq, slot = self._snapshot(offset)
+            if seq & 1 or self.mm[offset : offset + 8] != struct.pack("<Q", seq):
+                continue
+            break
+        else:
+            # a writer died half way, wait for the lock and take what is there.
+            # fcntl locks belong to the process: without self.lock this thread
+            # would get the lock of a writer thread of this worker, and its
+            # unlock would drop that writer's lock
+            with self.lock:
+                fcntl.lockf(self.fd, fcntl.LOCK_SH, self.slot_size, offset)
+                try:
+                    seq, slot = self._snapshot(offset)
+                finally:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, self.slot_size, offset)
+        return self._decode_name(slot)
+
+    def _write_slot(self, index: int, name: bytes, flags: int, ts: bytes, payload: bytes):
+        """must be called with the slot lock held"""
+        offset = self._offset(index)
+        seq = struct.unpack_from("<Q", self.mm, offset)[0]
+        seq += seq & 1
+        struct.pack_into("<Q", self.mm, offset, seq + 1)
+        data_start = offset + self.SLOT_HEADER.size
+        self.mm[data_start : data_start + len(payload)] = payload
+        self.SLOT_HEADER.pack_into(
+            self.mm, offset, seq + 1, flags, len(name), len(payload), name, ts
+        )
+        struct.pack_into("<Q", self.mm, offset, seq + 2)
+
+    @staticmethod
+    def _read_file(name: str) -> dict[str, Any] | None:
+        try:
+            with open(DATA_DIR / name / "latest.json", "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading latest state of {name}: {e}")
+            return None
+
+    def _decode(self, name: str, flags: int, ts: bytes, payload: bytes) -> dict[str, Any] | None:
+        if flags & self.FLAG_OVERFLOW:
+            # too large for a slot, latest.json is the source of truth
+            return self._read_file(name)
+        try:
+            return json.loads(payload)
+        except Exception as e:
+            print(f"Error decoding latest state of {name}: {e}")
+            return None
+
+    def get(self, hostname: str) -> dict[str, Any] | None:
+        for index in self._probe(hostname):
+            slot = self._read_slot(index)
+            if slot is None:
+                return None
+            if slot[0] == hostname:
+                return self._decode(*slot)
+        # table full, the host may live in latest.json only
+        return self._read_file(hostname)
+
+    def items(self):
+        names = set()
+        for index in range(self.slots):
+            slot = self._read_slot(index)
+            if slot is not None:
+                names.add(slot[0])
+                data = self._decode(*slot)
+                if data is not None:
+                    yield slot[0], data
+
+        if len(names) < self.slots:
+            return
+        # table full, serve the remaining hosts from their files
+        for entry in os.scandir(DATA_DIR):
+            if entry.name in names or entry.name.startswith(".") or not entry.is_dir():
+                continue
+            data = self._read_file(entry.name)
+            if data is not None:
+                yield entry.name, data
+
+    def update(self, hostname: str, fn):
+        """atomically replace the state of a host with ``fn(current)``
+
+        ``current`` is None for an unknown host, ``fn`` returns None to keep
+        the current state. Other workers updating the same host wait.
+        """
+        name = hostname.encode("utf-8")
+        if len(name) > 64:
+            raise ValueError(f"Hostname too long: {hostname}")
+
+        with self.lock:
+            for index in self._probe(hostname):
+                offset = self._offset(index)
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, self.slot_size, offset)
+                try:
+                    slot = self._read_slot(index, locked=True)
+                    if slot is not None and slot[0] != hostname:
+                        continue
+                    data = fn(self._decode(*slot) if slot is not None else None)
+                    if data is None:
+                        return
+                    ts = str(data.get("timestamp", "")).encode("utf-8")[:32]
+                    payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+                    flags = 0
+                    if len(payload) > self.max_payload:
+                        payload, flags = b"", self.FLAG_OVERFLOW
+                    self._write_slot(index, name, flags, ts, payload)
+                    return
+                finally:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, self.slot_size, offset)
+
+            # degraded: no slot left, ``fn`` keeps latest.json as the only copy
+            print(f"Latest state table is full, {hostname} is served from latest.json")
+            fn(self._read_file(hostname))
+
+    def put(self, hostname: str, data: dict[str, Any], only_if_newer: bool = False):
+        def replace(current):
+            if only_if_newer and current and current.get("timestamp", "") > data.get("timestamp", ""):
+                return None
+            return data
+
+        self.update(hostname, replace)
+
+
+LATEST_TABLE = LatestStateTable(
+    LATEST_TABLE_FILE, LATEST_TABLE_SLOTS, LATEST_TABLE_SLOT_SIZE
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_index()
+    tasks = [asyncio.create_task(save_manifest_periodically())]
+    if UPSTREAM_URL:
+        SPOOL_DIR.mkdir(exist_ok=True)
+        tasks.append(asyncio.create_task(forward_spool_periodically()))
+    yield
+    for task in tasks:
+        task.cancel()
+    save_manifest()
+
+
+app = FastAPI(title="Server Status Monitor", lifespan=lifespan)
+
+
+def write_json_atomic(path: Path, data: dict[str, Any]):
+    """concurrent workers may write the same file, never leave it half written"""
+    # ingest runs in threads too, the pid alone is not unique
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def update_disk_forecast(state: dict[str, float] | None, t: float, used_gb: float) -> dict[str, float]:
+    """one step of an exponentially weighted least squares fit of used_gb over time
+
+    Keeps the weighted sums of 1, t, y, t*t and t*y with t in hours relative to
+    the latest sample, so each report costs O(1) whatever the history length.
+    """
+    if state is None or t < state["t"]:
+        state = {"t": t, "w": 0.0, "st": 0.0, "sy": 0.0, "stt": 0.0, "sty": 0.0}
+
+    dt = t - state["t"]
+    decay = 0.5 ** (dt / FORECAST_HALF_LIFE_HOURS)
+    w, st, sy = state["w"], state["st"], state["sy"]
+    # move the origin to the new sample: old times become t_i - dt
+    stt = state["stt"] - 2 * dt * st + dt * dt * w
+    sty = state["sty"] - dt * sy
+    st = st - dt * w
+
+    return {
+        "t": t,
+        "w": w * decay + 1,
+        "st": st * decay,
+        "sy": sy * decay + used_gb,
+        "stt": stt * decay,
+        "sty": sty * decay,
+    }
+
+
+def disk_fill_rate(state: dict[str, float]) -> tuple[float, float] | None:
+    """(fitted used_gb now, growth in GB per hour) of a forecast state"""
+    w, st, sy = state["w"], state["st"], state["sy"]
+    denom = w * state["stt"] - st * st
+    if denom <= 1e-9:
+        # a single sample, or all samples in the same instant
+        return None
+    slope = (w * state["sty"] - st * sy) / denom
+    return (sy - slope * st) / w, slope
+
+
+def update_disk_forecasts(forecasts: dict[str, dict], data: dict[str, Any]) -> dict[str, dict]:
+    """forecast state of every mount in a report, keyed by mount point"""
+    t = datetime.fromisoformat(data["timestamp"]).timestamp() / 3600
+    updated = {}
+    for disk in data.get("disk", {}).get("disks", []):
+        mount_point = disk["mount_point"]
+        state = forecasts.get(mount_point)
+        if disk.get("available", True):
+            state = update_disk_forecast(state, t, disk["used_gb"])
+        if state is None:
+            continue
+
+        state = {k: state[k] for k in ("t", "w", "st", "sy", "stt", "sty")}
+        fit = disk_fill_rate(state)
+        state["gb_per_day"] = round(fit[1] * 24, 3) if fit else 0
+        state["hours_to_full"] = None
+        if fit and fit[1] > 0 and disk.get("total_gb"):
+            state["hours_to_full"] = round(max(0, (disk["total_gb"] - fit[0]) / fit[1]), 1)
+        updated[mount_point] = state
+    return updated
+
+
+def save_latest(hostname: str, data: dict[str, Any]):
+    server_dir = DATA_DIR / hostname
+    server_dir.mkdir(exist_ok=True)
+
+    def merge(current):
+        current = current or {}
+        if current.get("timestamp", "") >= data["timestamp"]:
+            # late or repeated report, only kept in history
+            return None
+        latest = dict(data)
+        latest["disk_forecast"] = update_disk_forecasts(
+            current.get("disk_forecast", {}), latest
+        )
+        write_json_atomic(server_dir / "latest.json", latest)
+        return latest
+
+    LATEST_TABLE.update(hostname, merge)
+
+
 def save_server_data(hostname: str, data: dict[str, Any]):
     server_dir = DATA_DIR / hostname
     server_dir.mkdir(exist_ok=True)
@@ -82,47 +446,434 @@ def save_server_data(hostname: str, data: dict[str, Any]):
     timestamp = datetime.fromisoformat(data["timestamp"])
     filename = timestamp.strftime("%Y%m%d%H.json")
 
-    with open(server_dir / filename, "w") as f:
-        json.dump(data, f, indent=2)
+    write_json_atomic(server_dir / filename, data)
+    save_latest(hostname, data)
+    add_to_history_index(hostname, datetime_hour(timestamp))
 
-    with open(server_dir / "latest.json", "w") as f:
-        json.dump(data, f, indent=2)
 
+SPOOL_THREAD_LOCK = threading.Lock()
 
-def get_all_servers() -> list[dict[str, Any]]:
-    servers = []
 
-    for hostname_dir in DATA_DIR.iterdir():
-        if hostname_dir.is_dir():
-            latest_file = hostname_dir / "latest.json"
-            if latest_file.exists():
+@contextmanager
+def spool_file_lock(spool_file: Path):
+    """serialize writers of a spool file across threads and workers"""
+    stripe = zlib.crc32(spool_file.name.encode("utf-8")) % SPOOL_LOCK_STRIPES
+    # fcntl locks do not exclude threads of the same process
+    with SPOOL_THREAD_LOCK:
+        fd = os.open(SPOOL_WRITE_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, stripe)
+            yield
+        finally:
+            # closing releases the lock
+            os.close(fd)
+
+
+def spool_report(hostname: str, data: dict[str, Any]):
+    """queue a report for upstream, one file per host and hour
+
+    The upstream keeps one history file per host and hour as well, so only
+    the newest report of each hour is worth forwarding.
+    """
+    timestamp = datetime.fromisoformat(data["timestamp"])
+    spool_file = SPOOL_DIR / f"{timestamp.strftime('%Y%m%d%H')}-{hostname}.json"
+    with spool_file_lock(spool_file):
+        try:
+            with open(spool_file, "r") as f:
+                if json.load(f)["timestamp"] > data["timestamp"]:
+                    return
+        except Exception:
+            pass
+        write_json_atomic(spool_file, data)
+
+
+def ingest_report(data: dict[str, Any]):
+    hostname = data.get("hostname")
+    if not hostname:
+        raise HTTPException(status_code=400, detail="Hostname is required")
+
+    if UPSTREAM_URL:
+        save_latest(hostname, data)
+        spool_report(hostname, data)
+    else:
+        save_server_data(hostname, data)
+    return hostname
+
+
+def forward_spool():
+    """send spooled reports upstream in gzipped batches, oldest hour first
+
+    Files are removed only once upstream accepted them, so reports survive
+    an unreachable upstream as well as a relay restart. Reports upstream
+    rejects as invalid (4xx) are moved to SPOOL_REJECTED_DIR, the others
+    are retried next interval without holding back the rest of the spool.
+    """
+    with open(SPOOL_LOCK_FILE, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # another worker is forwarding
+            return
+
+        attempted = set()
+        while True:
+            spool_files = sorted(
+                entry.path
+                for entry in os.scandir(SPOOL_DIR)
+                if entry.name.endswith(".json") and entry.path not in attempted
+            )[:RELAY_BATCH_SIZE]
+            if not spool_files:
+                return
+            attempted.update(spool_files)
+
+            batch, sent = [], []
+            for spool_file in spool_files:
                 try:
-                    with open(latest_file, "r") as f:
-                        data = json.load(f)
-                        data["last_updated"] = datetime.fromisoformat(
-                            data["timestamp"]
-                        ).strftime("%Y-%m-%d %H:%M:%S")
-                        servers.append(data)
+                    st = os.stat(spool_file)
+                    with open(spool_file, "r") as f:
+                        batch.append(json.load(f))
+                    sent.append((Path(spool_file), (st.st_ino, st.st_mtime_ns)))
                 except Exception as e:
-                    print(f"Error reading {latest_file}: {e}")
+                    print(f"Error reading {spool_file}: {e}")
+            if not batch:
+                continue
+
+            req = urllib.request.Request(
+                url=f"{UPSTREAM_URL}/report/batch",
+                data=gzip.compress(json.dumps(batch).encode("utf-8")),
+                headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=30) as response:
+                    result = json.load(response)
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                print(f"Error forwarding {len(batch)} reports to {UPSTREAM_URL}: {e}")
+                return
+
+            rejected = {item["index"]: item for item in result.get("rejected", [])}
+            for i, (spool_file, identity) in enumerate(sent):
+                item = rejected.get(i)
+                if item is not None and not 400 <= item["status"] < 500:
+                    # upstream failed on its side, retry next interval
+                    continue
+                if item is not None:
+                    print(f"Upstream rejected {spool_file.name}: {item['detail']}")
+                with spool_file_lock(spool_file):
+                    try:
+                        # replaced by a newer report meanwhile, keep it for the next batch,
+                        # a rename swaps the inode even within the mtime granularity
+                        st = os.stat(spool_file)
+                        if (st.st_ino, st.st_mtime_ns) != identity:
+                            continue
+                        if item is None:
+                            os.unlink(spool_file)
+                        else:
+                            SPOOL_REJECTED_DIR.mkdir(exist_ok=True)
+                            os.replace(spool_file, SPOOL_REJECTED_DIR / spool_file.name)
+                    except FileNotFoundError:
+                        pass
+
+
+async def forward_spool_periodically():
+    while True:
+        await asyncio.sleep(RELAY_INTERVAL)
+        await asyncio.to_thread(forward_spool)
+
+
+HISTORY_NAME = re.compile(r"^(\d{10})\.json$")
+
+# hostname -> {"mtime": host dir mtime_ns it is complete for, "hours": [[first hour, count], ...]}
+HISTORY_INDEX: dict[str, dict[str, Any]] = {}
+HISTORY_INDEX_LOCK = threading.Lock()
+
+
+def history_hour(name: str) -> int | None:
+    """hours since epoch of a %Y%m%d%H.json history file"""
+    match = HISTORY_NAME.match(name)
+    if not match:
+        return None
+    return datetime_hour(datetime.strptime(match.group(1), "%Y%m%d%H"))
+
+
+def datetime_hour(moment: datetime) -> int:
+    """hour ordinal of a naive timestamp, as used by the history index"""
+    return int(moment.replace(tzinfo=timezone.utc).timestamp()) // 3600
+
+
+def history_name(hour: int) -> str:
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%Y%m%d%H.json")
+
+
+def iter_history_hours(
+    ranges: list[list[int]],
+    reverse: bool = False,
+    first: int | None = None,
+    last: int | None = None,
+):
+    """hours of the index, optionally clipped to [first, last]"""
+    for start, count in reversed(ranges) if reverse else ranges:
+        hours = range(
+            start if first is None else max(start, first),
+            start + count if last is None else min(start + count, last + 1),
+        )
+        yield from reversed(hours) if reverse else hours
+
+
+def hours_to_ranges(hours) -> list[list[int]]:
+    """sorted hours -> runs of consecutive hours"""
+    ranges: list[list[int]] = []
+    for hour in hours:
+        if ranges and ranges[-1][0] + ranges[-1][1] > hour:
+            # duplicate
+            continue
+        if ranges and ranges[-1][0] + ranges[-1][1] == hour:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([hour, 1])
+    return ranges
+
+
+def merge_history_hours(ranges: list[list[int]], other: list[list[int]]) -> list[list[int]]:
+    return hours_to_ranges(
+        heapq.merge(iter_history_hours(ranges), iter_history_hours(other))
+    )
+
+
+def scan_history(server_dir: Path) -> dict[str, Any]:
+    """index of the history files of a host, runs of consecutive hours"""
+    mtime = server_dir.stat().st_mtime_ns
+    hours = sorted(
+        hour
+        for hour in (history_hour(entry.name) for entry in os.scandir(server_dir))
+        if hour is not None
+    )
+    return {"mtime": mtime, "hours": hours_to_ranges(hours)}
+
+
+def reconcile_history(
+    server_dir: Path, index: dict[str, Any], latest: dict[str, Any] | None
+) -> dict[str, Any]:
+    """add the files written after ``index`` without listing the directory
+
+    History files are named by hour, so the new ones are found by probing the
+    missing hours between the time ``index`` was complete and the latest
+    report. A report more than RECONCILE_SLACK_HOURS late is only picked up
+    by a full scan.
+    """
+    mtime = server_dir.stat().st_mtime_ns
+    ranges = index["hours"]
+    if not ranges or latest is None:
+        return scan_history(server_dir)
+
+    last = ranges[-1][0] + ranges[-1][1] - 1
+    since = datetime_hour(datetime.fromtimestamp(index["mtime"] / 1e9)) - RECONCILE_SLACK_HOURS
+    first = min(last + 1, since)
+    until = datetime_hour(datetime.fromisoformat(latest["timestamp"]))
+    if until - first > RECONCILE_MAX_HOURS:
+        return scan_history(server_dir)
+    known = set(iter_history_hours(ranges, first=first, last=until))
+    new_hours = [
+        hour
+        for hour in range(first, until + 1)
+        if hour not in known and (server_dir / history_name(hour)).exists()
+    ]
+    return {"mtime": mtime, "hours": merge_history_hours(ranges, [[h, 1] for h in new_hours])}
+
+
+def add_to_history_index(hostname: str, hour: int):
+    """record a history file just written
+
+    The index mtime is left alone: another worker may have written to the
+    directory meanwhile, so only a reconcile can mark the index complete.
+    """
+    server_dir = DATA_DIR / hostname
+    with HISTORY_INDEX_LOCK:
+        index = HISTORY_INDEX.get(hostname)
+        if index is None:
+            # first report of a new host
+            HISTORY_INDEX[hostname] = scan_history(server_dir)
+            return
+        HISTORY_INDEX[hostname] = {
+            "mtime": index["mtime"],
+            "hours": merge_history_hours(index["hours"], [[hour, 1]]),
+        }
+
+
+def get_history_index(hostname: str) -> dict[str, Any] | None:
+    """history index of a host, reconciled only when its directory changed"""
+    server_dir = DATA_DIR / hostname
+    if hostname.startswith(".") or not server_dir.is_dir():
+        return None
+    mtime = server_dir.stat().st_mtime_ns
+    index = HISTORY_INDEX.get(hostname)
+    if index is None:
+        index = HISTORY_INDEX[hostname] = scan_history(server_dir)
+    elif index["mtime"] != mtime:
+        # written by another worker
+        index = HISTORY_INDEX[hostname] = reconcile_history(
+            server_dir, index, LATEST_TABLE.get(hostname)
+        )
+    return index
+
+
+def build_host(data_dir: Path, hostname: str, cached: dict[str, Any] | None = None) -> dict[str, Any]:
+    """manifest entry of a host, reconciled from ``cached`` or rebuilt from its files"""
+    server_dir = data_dir / hostname
+    latest = None
+    try:
+        with open(server_dir / "latest.json", "r") as f:
+            latest = json.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error reading {server_dir / 'latest.json'}: {e}")
+
+    if cached is not None:
+        entry = reconcile_history(server_dir, cached, latest)
+    else:
+        entry = scan_history(server_dir)
+    entry["latest"] = latest
+
+    if latest is not None and "disk_forecast" not in latest:
+        # written before forecasting existed, replay the recent history once
+        forecasts = {}
+        last_hour = datetime_hour(datetime.fromisoformat(latest["timestamp"]))
+        first = last_hour - FORECAST_REPLAY_HALF_LIVES * FORECAST_HALF_LIFE_HOURS
+        for hour in iter_history_hours(entry["hours"], first=first):
+            try:
+                with open(server_dir / history_name(hour), "r") as f:
+                    forecasts = update_disk_forecasts(forecasts, json.load(f))
+            except Exception as e:
+                print(f"Error replaying {server_dir / history_name(hour)}: {e}")
+        latest["disk_forecast"] = update_disk_forecasts(forecasts, latest)
+    return entry
+
+
+def build_host_shard(
+    data_dir: Path, hosts: list[tuple[str, dict[str, Any] | None]]
+) -> dict[str, dict[str, Any]]:
+    return {hostname: build_host(data_dir, hostname, cached) for hostname, cached in hosts}
+
+
+def build_hosts(hosts: list[tuple[str, dict[str, Any] | None]]) -> dict[str, dict[str, Any]]:
+    """(hostname, manifest entry or None) -> entries, sharded across processes"""
+    workers = min(os.cpu_count() or 1, len(hosts))
+    if workers <= 1:
+        return build_host_shard(DATA_DIR, hosts)
+
+    shards = [hosts[i::workers] for i in range(workers)]
+    entries = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for shard in executor.map(build_host_shard, [DATA_DIR] * workers, shards):
+            entries.update(shard)
+    return entries
+
+
+def read_manifest() -> dict[str, dict[str, Any]]:
+    try:
+        with gzip.open(MANIFEST_FILE, "rt") as f:
+            manifest = json.load(f)
+        return manifest["hosts"] if manifest.get("version") == 1 else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Error reading {MANIFEST_FILE}: {e}")
+        return {}
+
+
+def write_manifest(hosts: dict[str, dict[str, Any]]):
+    tmp = MANIFEST_FILE.with_name(
+        f"{MANIFEST_FILE.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    with gzip.open(tmp, "wt") as f:
+        json.dump({"version": 1, "generated": time.time(), "hosts": hosts}, f)
+    os.replace(tmp, MANIFEST_FILE)
+
+
+def load_index():
+    """load the manifest, reconcile hosts whose directory changed since"""
+    with open(MANIFEST_LOCK_FILE, "w") as lock:
+        # the first worker reconciles, the others find an up to date manifest
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = read_manifest()
+        hosts, stale = {}, []
+        for entry in os.scandir(DATA_DIR):
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            cached = manifest.get(entry.name)
+            if cached is not None and cached["mtime"] == entry.stat().st_mtime_ns:
+                hosts[entry.name] = cached
+            else:
+                stale.append((entry.name, cached))
+
+        if stale:
+            print(f"Indexing {len(stale)} of {len(hosts) + len(stale)} hosts...")
+            hosts.update(build_hosts(stale))
+            write_manifest(hosts)
+
+    for hostname, entry in hosts.items():
+        HISTORY_INDEX[hostname] = {"mtime": entry["mtime"], "hours": entry["hours"]}
+        if entry["latest"] is not None:
+            LATEST_TABLE.put(hostname, entry["latest"], only_if_newer=True)
+
+
+def save_manifest():
+    """merge this worker's index into the manifest, each worker knows its own reports"""
+    try:
+        with open(MANIFEST_LOCK_FILE, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            hosts = read_manifest()
+            for hostname, index in list(HISTORY_INDEX.items()):
+                saved = hosts.get(hostname)
+                if saved is not None:
+                    # complete up to the newer of both mtimes once merged
+                    index = {
+                        "mtime": max(index["mtime"], saved["mtime"]),
+                        "hours": merge_history_hours(index["hours"], saved["hours"]),
+                    }
+                hosts[hostname] = index
+            for hostname in list(hosts):
+                if not (DATA_DIR / hostname).is_dir():
+                    del hosts[hostname]
+                    continue
+                hosts[hostname]["latest"] = LATEST_TABLE.get(hostname)
+            write_manifest(hosts)
+    except Exception as e:
+        print(f"Error writing {MANIFEST_FILE}: {e}")
+
+
+async def save_manifest_periodically():
+    while True:
+        await asyncio.sleep(MANIFEST_INTERVAL)
+        await asyncio.to_thread(save_manifest)
+
+
+def get_all_servers() -> list[dict[str, Any]]:
+    servers = []
+
+    for hostname, data in LATEST_TABLE.items():
+        try:
+            data["last_updated"] = datetime.fromisoformat(data["timestamp"]).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            )
+            servers.append(data)
+        except Exception as e:
+            print(f"Error reading latest state of {hostname}: {e}")
 
     return sorted(servers, key=lambda x: x["hostname"])
 
 
 def get_server_history(hostname: str, limit: int = 20) -> list[dict[str, Any]]:
     server_dir = DATA_DIR / hostname
-    if not server_dir.exists() or not server_dir.is_dir():
+    index = get_history_index(hostname)
+    if index is None:
         return []
 
     history = []
-    json_files = list(server_dir.glob("*.json"))
-    json_files = [f for f in json_files if f.name != "latest.json"]
-
-    json_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-
-    json_files = json_files[:limit]
-
-    for json_file in json_files:
+    for hour in iter_history_hours(index["hours"], reverse=True):
+        if len(history) >= limit:
+            break
+        json_file = server_dir / history_name(hour)
         try:
             with open(json_file, "r") as f:
                 data = json.load(f)
@@ -136,23 +887,224 @@ def get_server_history(hostname: str, limit: int = 20) -> list[dict[str, Any]]:
     return history
 
 
+def list_hostnames() -> list[str]:
+    return sorted(
+        entry.name
+        for entry in os.scandir(DATA_DIR)
+        if not entry.name.startswith(".") and entry.is_dir()
+    )
+
+
+def flatten_report(data: dict[str, Any], prefix: str = "") -> dict[str, Any]:
+    """``{"cpu": {"usage": 1}}`` -> ``{"cpu.usage": 1}``
+
+    List items are keyed by their mount point, interface, index, pid or name,
+    e.g. ``disk.disks./.used_percent``, ``gpu.gpus.0.utilization`` or
+    ``diskio.devices.sda.util_percent``.
+    """
+    flat = {}
+    for key, value in data.items():
+        key = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_report(value, f"{key}."))
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                if not isinstance(item, dict):
+                    flat[f"{key}.{i}"] = item
+                    continue
+                item_key = next(
+                    (item[k] for k in ("mount_point", "interface", "index", "pid", "name") if k in item),
+                    i,
+                )
+                flat.update(flatten_report(item, f"{key}.{item_key}."))
+        else:
+            flat[key] = value
+    return flat
+
+
+def parse_export_time(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {value}")
+    # reports carry naive local timestamps
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def iter_export_records(hostnames: list[str], start: datetime | None, end: datetime | None):
+    """history reports in time order per host, read one file at a time"""
+    first = datetime_hour(start) if start else None
+    last = datetime_hour(end) if end else None
+    for hostname in hostnames:
+        index = get_history_index(hostname)
+        if index is None:
+            continue
+        for hour in iter_history_hours(index["hours"], first=first, last=last):
+            json_file = DATA_DIR / hostname / history_name(hour)
+            try:
+                with open(json_file, "r") as f:
+                    data = json.load(f)
+                timestamp = datetime.fromisoformat(data["timestamp"])
+            except Exception as e:
+                print(f"Error reading {json_file}: {e}")
+                continue
+            if (start and timestamp < start) or (end and timestamp > end):
+                continue
+            yield data
+
+
+def iter_export(records, fields: list[str], format: str, compress: bool):
+    """encoded export chunks, buffered and optionally gzipped on the fly"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if format == "csv" else None
+    if writer:
+        writer.writerow(fields)
+
+    def drain() -> bytes:
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(chunk) if compressor else chunk
+
+    for data in records:
+        flat = flatten_report(data)
+        if writer:
+            writer.writerow([flat.get(field, "") for field in fields])
+        else:
+            buffer.write(json.dumps({field: flat.get(field) for field in fields}))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            chunk = drain()
+            if chunk:
+                yield chunk
+
+    chunk = drain()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
 @app.post("/report")
 async def report_status(request: Request):
     """main endpoint for clients"""
     try:
         data = await request.json()
-        hostname = data.get("hostname")
-
-        if not hostname:
-            raise HTTPException(status_code=400, detail="Hostname is required")
-
-        save_server_data(hostname, data)
+        # may wait on another worker's slot lock, keep the event loop free
+        hostname = await asyncio.to_thread(ingest_report, data)
         return {"status": "ok", "message": f"Data received for {hostname}"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/report/batch")
+async def report_batch(request: Request):
+    """batches forwarded by relays, optionally gzip encoded
+
+    Each report is ingested on its own, the response lists the indexes of
+    the rejected ones so the relay can retry or drop just those.
+    """
+    try:
+        body = await request.body()
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        reports = json.loads(body)
+        if not isinstance(reports, list):
+            raise ValueError("Expected a list of reports")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def ingest_all():
+        accepted, rejected = [], []
+        for i, data in enumerate(reports):
+            try:
+                ingest_report(data)
+                accepted.append(i)
+            except HTTPException as e:
+                rejected.append({"index": i, "status": e.status_code, "detail": e.detail})
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                # malformed report, resending it will not help
+                rejected.append({"index": i, "status": 400, "detail": str(e)})
+            except Exception as e:
+                rejected.append({"index": i, "status": 500, "detail": str(e)})
+        return accepted, rejected
+
+    accepted, rejected = await asyncio.to_thread(ingest_all)
+    return {
+        "status": "ok",
+        "message": f"{len(accepted)} of {len(reports)} reports accepted",
+        "accepted": accepted,
+        "rejected": rejected,
+    }
+
+
+@app.get("/api/forecast")
+async def disk_forecast(hostname: str | None = None):
+    """time-to-full of every disk, soonest first"""
+    forecasts = []
+    for host, data in LATEST_TABLE.items():
+        if hostname and host != hostname:
+            continue
+        states = data.get("disk_forecast", {})
+        for disk in data.get("disk", {}).get("disks", []):
+            state = states.get(disk["mount_point"])
+            if state is None:
+                continue
+            forecasts.append(
+                {
+                    "hostname": host,
+                    "device": disk["device"],
+                    "mount_point": disk["mount_point"],
+                    "used_gb": disk["used_gb"],
+                    "total_gb": disk["total_gb"],
+                    "gb_per_day": state["gb_per_day"],
+                    "hours_to_full": state["hours_to_full"],
+                }
+            )
+
+    return sorted(
+        forecasts,
+        key=lambda x: (x["hours_to_full"] is None, x["hours_to_full"] or 0),
+    )
+
+
+@app.get("/api/export")
+async def export_history(
+    request: Request,
+    hosts: str = "",
+    start: str | None = Query(None, alias="from"),
+    end: str | None = Query(None, alias="to"),
+    format: str = "ndjson",
+    fields: str = "",
+):
+    """stream history as NDJSON or CSV, e.g. /api/export?hosts=a,b&format=csv"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+
+    known = list_hostnames()
+    requested = {h for h in hosts.split(",") if h}
+    # never let the query string name paths outside the data directory
+    hostnames = [h for h in known if h in requested] if requested else known
+    selected = [f for f in fields.split(",") if f] or EXPORT_DEFAULT_FIELDS
+    records = iter_export_records(hostnames, parse_export_time(start), parse_export_time(end))
+
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition": f"attachment; filename=export.{format}"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        iter_export(records, selected, format, compress),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers=headers,
+    )
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     servers = get_all_servers()
@@ -176,6 +1128,10 @@ async def server_list(request: Request):
 @app.get("/server/{hostname}", response_class=HTMLResponse)
 async def server_detail(request: Request, hostname: str):
     history = get_server_history(hostname)
+    if not history and UPSTREAM_URL:
+        # a relay keeps no history, show the latest report alone
+        latest_state = LATEST_TABLE.get(hostname)
+        history = [latest_state] if latest_state else []
 
     if not history:
         raise HTTPException(
@@ -189,6 +1145,7 @@ async def server_detail(request: Request, hostname: str):
             break
 
     latest = history[0] if history else None
+    latest_state = LATEST_TABLE.get(hostname) or {}
 
     return templates.TemplateResponse(
         "server_detail.html",
@@ -198,6 +1155,7 @@ async def server_detail(request: Request, hostname: str):
             "history": history,
             "has_gpu": has_gpu,
             "latest": latest,
+            "disk_forecast": latest_state.get("disk_forecast", {}),
             "get_avg_disk_usage": get_avg_disk_usage,
         },
     )
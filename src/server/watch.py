@@ -18,6 +18,8 @@ from rich.text import Text
 
 DANGER_LIMIT = 90
 WARN_LIMIT = 70
+# disks forecast to fill up within this many hours are in danger too
+FORECAST_HORIZON_HOURS = 7 * 24
 
 def create_default_table() -> Table:
     return Table(show_header=True, expand=True)
@@ -146,6 +148,17 @@ def create_disk_section(disk_data: dict):
     disk_table.add_column("使用率", style="magenta")
 
     for disk in disk_data["disks"]:
+        if not disk.get("available", True):
+            disk_table.add_row(
+                f"{disk['device']}",
+                f"{disk['mount_point']}",
+                f"{disk['fs_type']}",
+                "-",
+                "-",
+                Text(f"unavailable ({disk.get('error', 'unknown')})", style="red"),
+            )
+            continue
+
         disk_usage = disk["used_percent"]
         progress_bar = create_progress_bar(disk_usage, True)
 
@@ -194,9 +207,14 @@ def create_server_block(data_dir: str) -> tuple[Panel, dict[str, list[dict]]]:
     layout = Layout(size=total_size)
     layout.split_column(*items)
 
-    danger_disks = [
-        disk for disk in data["disk"]["disks"] if disk["used_percent"] > DANGER_LIMIT
-    ]
+    forecasts = data.get("disk_forecast", {})
+    danger_disks = []
+    for disk in data["disk"]["disks"]:
+        hours_to_full = forecasts.get(disk["mount_point"], {}).get("hours_to_full")
+        if disk["used_percent"] > DANGER_LIMIT or (
+            hours_to_full is not None and hours_to_full < FORECAST_HORIZON_HOURS
+        ):
+            danger_disks.append(dict(disk, hours_to_full=hours_to_full))
     return Panel(layout, title=data["hostname"], height=total_size + 2), {data["hostname"]: danger_disks}
 
 def create_danger_block(disk_info: dict[str, list[dict]]) -> Panel:
@@ -206,20 +224,31 @@ def create_danger_block(disk_info: dict[str, list[dict]]) -> Panel:
     disk_table.add_column("挂载点", style="green")
     disk_table.add_column("可用", style="yellow")
     disk_table.add_column("使用率", style="magenta")
+    disk_table.add_column("预计写满", style="red")
 
     for host, disks in disk_info.items():
         for disk in disks:
+            hours_to_full = disk.get("hours_to_full")
             disk_table.add_row(
                 f"{host}",
                 f"{disk['device']}",
                 f"{disk['mount_point']}",
                 f"{disk['free_gb']:.2f} GB",
                 create_progress_bar(disk["used_percent"], True),
+                f"{hours_to_full / 24:.1f} 天" if hours_to_full is not None else "-",
             )
     return Panel(disk_table, title="Disks in danger")
 
+def list_hosts(data_root: str) -> list[str]:
+    # skip server bookkeeping such as the shared latest-state table
+    return sorted(
+        host
+        for host in os.listdir(data_root)
+        if not host.startswith(".") and os.path.isdir(os.path.join(data_root, host))
+    )
+
 def loop_latest_data(data_root: str):
-    for host in os.listdir(data_root):
+    for host in list_hosts(data_root):
         yield host, load_data(os.path.join(data_root, host))
 
 def create_offline_block(data_root: str) -> Panel|None:
@@ -238,7 +267,7 @@ def create_offline_block(data_root: str) -> Panel|None:
 def display_latest(data_root: str):
     console = Console()
     danger_disks = {}
-    for host in os.listdir(data_root):
+    for host in list_hosts(data_root):
         block, disks = create_server_block(os.path.join(data_root, host))
         console.print(block)
         danger_disks.update(disks)